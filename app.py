@@ -1,14 +1,26 @@
 # app.py
 
 import os
+import re
 import json
+import orjson
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
 from dotenv import load_dotenv
 import google.generativeai as genai
-import re
+from google.api_core import exceptions as google_exceptions
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import base64
+import functools
+import hashlib
+import io
 import time
+import threading
+import urllib.parse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 # --- 1. SETUP AND CONFIGURATION ---
 load_dotenv()
@@ -18,6 +30,8 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 GITHUB_USERNAME = os.getenv("GITHUB_USERNAME")
 GITHUB_API_URL = "https://api.github.com"
+COMMITTER = {"name": "LLM Code Bot", "email": "bot@example.com"}
+JSON_HEADERS = {"Content-Type": "application/json"}
 
 required_keys = ["MY_APP_SECRET", "GEMINI_API_KEY", "GITHUB_TOKEN", "GITHUB_USERNAME"]
 for key in required_keys:
@@ -25,146 +39,342 @@ for key in required_keys:
         raise ValueError(f"Error: Missing required environment variable '{key}'")
 
 genai.configure(api_key=GEMINI_API_KEY)
+GEMINI_MODEL = genai.GenerativeModel('gemini-2.5-flash')
+# Generous per-call deadline: a full page from a thinking model can take well over a minute
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "180"))
+GEMINI_RETRYABLE_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.ResourceExhausted,
+)
+
+class OrjsonProvider(JSONProvider):
+    """Routes Flask's request parsing and jsonify through orjson."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # orjson already produces bytes, so skip the str round-trip of dumps()
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype="application/json")
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+# Shared session so every GitHub API call reuses pooled keep-alive connections
+_gh_session = requests.Session()
+_gh_session.headers.update({"Authorization": f"token {GITHUB_TOKEN}", "Accept": "application/vnd.github.v3+json"})
+_gh_session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=10,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504], raise_on_status=False),
+))
+
+# The evaluation server is a different host, so it gets its own session and connection pool
+_notify_session = requests.Session()
+_notify_session.headers.update(JSON_HEADERS)
+_notify_adapter = HTTPAdapter(max_retries=Retry(
+    total=4,
+    backoff_factor=1,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=["POST"],
+    respect_retry_after_header=True,
+))
+# evaluation_url may be plain http, so both schemes need the retrying adapter
+_notify_session.mount("https://", _notify_adapter)
+_notify_session.mount("http://", _notify_adapter)
+
+# Build/revise tasks run on this pool so the webhook can answer immediately. Vercel freezes
+# the function once the response is sent, so there the task still runs inside the request.
+TASK_EXECUTOR = ThreadPoolExecutor(max_workers=8)
+RUN_TASKS_IN_BACKGROUND = not os.getenv("VERCEL")
+REQUIRED_REQUEST_FIELDS = ["task", "brief", "email", "nonce", "evaluation_url"]
+
+# (repo_name, file_path) -> (etag, {"content": ..., "sha": ...}) for conditional GETs
+_file_cache = {}
+
+# repo_name -> Pages URL, so repos already seen skip the Pages API entirely.
+# Also saved under STATE_DIR so the URL survives restarts.
+_pages_url_cache = {}
+STATE_DIR = Path(os.getenv("STATE_DIR", ".state"))
+
+# (repo_name, file_path) -> {"content": ..., "sha": ...} as last pushed by this process
+PUSHED_FILES_TO_REMEMBER = {"README.md"}
+_pushed_files = {}
 
 # --- NEW HELPER FUNCTION TO PROCESS ATTACHMENTS ---
+def _decode_data_uri(url):
+    """Decodes a "data:<media_type>[;charset=...][;base64],<data>" URI to text."""
+    header, comma, payload = url.partition(',')
+    if not header.startswith("data:") or not comma:
+        raise ValueError("not a data URI")
+    _, *params = header.removeprefix("data:").split(';')
+    if "base64" in params:
+        raw = base64.b64decode(payload)
+    else:
+        # Plain data URIs are percent-encoded text, so there is nothing to base64-decode
+        raw = urllib.parse.unquote_to_bytes(payload)
+    charset = next((p.partition('=')[2] for p in params if p.lower().startswith("charset=")), "utf-8")
+    return raw.decode(charset)
+
 def process_attachments(attachments):
     """Decodes data URIs from attachments and returns their formatted content."""
     if not attachments:
         return ""
     
-    content_list = []
-    for attachment in attachments:
+    # Sections are written straight into one buffer rather than collected in a list and joined
+    buf = io.StringIO()
+    for i, attachment in enumerate(attachments):
+        if i:
+            buf.write("\n\n")
         try:
-            # Format is "data:<media_type>;base64,<data>"
-            header, encoded = attachment['url'].split(',', 1)
-            decoded_content = base64.b64decode(encoded).decode('utf-8')
-            content_list.append(f"--- Attachment File: {attachment['name']} ---\n{decoded_content}\n--- End of {attachment['name']} ---")
+            decoded_content = _decode_data_uri(attachment['url'])
         except Exception as e:
             print(f"⚠️  Could not decode attachment {attachment.get('name', 'N/A')}: {e}")
-            content_list.append(f"--- Attachment File: {attachment['name']} (DECODING FAILED) ---")
+            buf.write(f"--- Attachment File: {attachment['name']} (DECODING FAILED) ---")
+            continue
+        buf.write(f"--- Attachment File: {attachment['name']} ---\n")
+        buf.write(decoded_content)
+        buf.write(f"\n--- End of {attachment['name']} ---")
 
-    return "\n\n".join(content_list)
+    return buf.getvalue()
 
 # --- 2. LLM (GEMINI) HELPER FUNCTIONS (UPGRADED PROMPTS) ---
 
-def generate_code_with_gemini(brief, checks, attachments_content):
+# Static instructions go first and per-request data last, so every call shares the same
+# prompt prefix and Gemini's prefix caching can reuse it.
+CODE_GEN_PREFIX = """You are an expert full-stack web developer. Your task is to build a single-page web application based on the BRIEF below.
+You must generate a single index.html file that includes all necessary HTML, CSS, and JavaScript.
+Use CDN links for any external libraries like Bootstrap or jQuery if needed.
+The generated code must be correct and directly usable.
+The code will be evaluated against the EVALUATION CHECKS below. Ensure the generated code can pass them.
+The user may provide ATTACHED FILE CONTENTS. Use them to complete the brief.
+Respond ONLY with the complete HTML code inside a single markdown code block. Do not add any explanatory comments.
+"""
+
+CODE_REVISE_PREFIX = """You are an expert full-stack web developer. Your task is to revise the ORIGINAL `index.html` CODE below based on a NEW REVISION BRIEF.
+The updated code must pass the NEW EVALUATION CHECKS below.
+Do not add any explanatory comments, just provide the final, complete, updated code.
+Long inline data has been replaced by placeholders like `data:inline/0,`. Keep every placeholder exactly as written wherever that data is still needed.
+Respond ONLY with the complete and updated HTML code inside a single markdown code block.
+"""
+
+# Comments (but not IE conditional comments) and long inline data URIs cost prompt tokens without
+# helping the model revise the page. Raw-text elements are matched first and kept whole, since
+# "<!--" inside a script, style, textarea or pre body is code or content, not a comment.
+_HTML_COMMENT_RE = re.compile(
+    r"(<(script|style|textarea|pre)\b.*?</\2\s*>)|<!--(?!\[if).*?-->",
+    re.DOTALL | re.IGNORECASE,
+)
+_LONG_DATA_URI_RE = re.compile(r"data:[\w/+.-]*(?:;[\w=.-]+)*,[A-Za-z0-9+/=%._~-]{256,}")
+
+README_GEN_PREFIX = """You are a professional technical writer. Based on the APPLICATION BRIEF below, write a professional README.md file.
+The README must include the following sections:
+- A suitable title for the project.
+- Summary: A brief summary of what the project does.
+- Setup: Explain that it's a static site and no local setup is needed to run it.
+- Usage: Explain how to view and use the live deployed page.
+- Code Explanation: Briefly explain how the HTML, CSS, and JavaScript work together to achieve the goal.
+- License: State that the project is under the MIT License.
+Respond ONLY with the complete markdown content for the README.md file.
+"""
+
+README_REVISE_PREFIX = """You are a technical writer. Your task is to update the ORIGINAL README.md CONTENT below based on a NEW BRIEF FOR CHANGES describing changes to the application.
+Ensure the summary, usage, and code explanation sections are updated to reflect the new functionality.
+Respond ONLY with the complete and updated markdown content for the README.md file.
+"""
+
+# Exact-match cache of Gemini results, keyed by model, helper and arguments.
+# Set LLM_CACHE=1 to also persist results on disk so they survive restarts.
+LLM_CACHE_TTL = 24 * 60 * 60
+LLM_CACHE_MAX_ENTRIES = 256
+LLM_CACHE_DIR = Path(os.getenv("LLM_CACHE_DIR", ".llm_cache")) if os.getenv("LLM_CACHE") == "1" else None
+_llm_cache = {}
+_cache_lock = threading.Lock()
+
+def _bounded_set(cache, key, value):
+    """Stores value in a module-level cache dict, evicting the oldest entry once it is full."""
+    # Task threads write these caches concurrently, so evict-and-insert must be atomic. A cache
+    # is only an optimisation: a failure here is logged and never fails the task that called it.
+    try:
+        with _cache_lock:
+            if key not in cache and len(cache) >= LLM_CACHE_MAX_ENTRIES:
+                cache.pop(next(iter(cache)), None)
+            cache[key] = value
+    except Exception as e:
+        print(f"⚠️  Could not update cache: {e}")
+
+def _cache_key(*parts):
+    return hashlib.sha256(orjson.dumps(parts, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def _read_disk_cache(key):
+    path = LLM_CACHE_DIR / key
+    try:
+        if path.stat().st_mtime + LLM_CACHE_TTL > time.time():
+            return path.read_text(encoding='utf-8')
+    except OSError:
+        pass
+    return None
+
+def _write_disk_cache(key, result):
+    try:
+        LLM_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so concurrent readers never see a partial file
+        tmp_path = LLM_CACHE_DIR / f"{key}.{threading.get_ident()}.tmp"
+        tmp_path.write_text(result, encoding='utf-8')
+        tmp_path.replace(LLM_CACHE_DIR / key)
+    except OSError as e:
+        # Read-only filesystems (e.g. Vercel) just lose the on-disk copy
+        print(f"⚠️  Could not save Gemini result to disk cache: {e}")
+
+class UncachedResult(str):
+    """A helper's fallback output (e.g. unextractable code) that cached_llm returns but never stores."""
+
+def cached_llm(fn):
+    """Returns the earlier result for identical arguments instead of calling Gemini again."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = _cache_key(GEMINI_MODEL.model_name, fn.__name__, args, kwargs)
+        cached = _llm_cache.get(key)
+        if cached and cached[0] > time.time():
+            print(f"♻️  Reusing cached Gemini result for {fn.__name__}.")
+            return cached[1]
+        result = _read_disk_cache(key) if LLM_CACHE_DIR else None
+        if result is not None:
+            print(f"♻️  Reusing Gemini result for {fn.__name__} from disk cache.")
+        else:
+            result = fn(*args, **kwargs)
+            if isinstance(result, UncachedResult):
+                # Let a retry with the same input ask Gemini again
+                return str(result)
+            if LLM_CACHE_DIR:
+                _write_disk_cache(key, result)
+        _bounded_set(_llm_cache, key, (time.time() + LLM_CACHE_TTL, result))
+        return result
+    return wrapper
+
+def _gemini_call(prompt):
+    """Calls Gemini with a timeout, retrying transient failures with backoff."""
+    for i, delay in enumerate([1, 2, 4, 8]):
+        try:
+            return GEMINI_MODEL.generate_content(prompt, request_options={"timeout": GEMINI_TIMEOUT})
+        except GEMINI_RETRYABLE_ERRORS as e:
+            if i == 3:
+                raise
+            print(f"⚠️ Gemini call failed: {e}. Retrying in {delay}s...")
+            time.sleep(delay)
+
+def _extract_html_block(text):
+    """Returns the contents of the first ```html fenced block in text, or None if there is none."""
+    _, fence, rest = text.partition('```html')
+    if not fence:
+        return None
+    code, _, _ = rest.partition('```')
+    return code.strip()
+
+@cached_llm
+def generate_code_with_gemini(brief, checks_str, attachments_str):
     """Generates application code from scratch using an enhanced prompt."""
     print("🧠 Calling Gemini API to generate initial code...")
     
     # --- PROMPT ENHANCEMENT: Added checks and attachments ---
-    prompt = f"""
-    You are an expert full-stack web developer. Your task is to build a single-page web application based on the following brief.
-    You must generate a single index.html file that includes all necessary HTML, CSS, and JavaScript.
-    Use CDN links for any external libraries like Bootstrap or jQuery if needed.
-    The generated code must be correct and directly usable.
-
-    BRIEF:
-    {brief}
-
-    EVALUATION CHECKS:
-    The code will be evaluated against these checks. Ensure the generated code can pass them:
-    - {'- '.join(checks)}
-
-    ATTACHED FILE CONTENTS:
-    The user has provided the following file contents. Use them to complete the brief.
-    {attachments_content if attachments_content else "None"}
-
-    Respond ONLY with the complete HTML code inside a single markdown code block. Do not add any explanatory comments.
-    """
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    response = model.generate_content(prompt)
-    try:
-        code = re.search(r'```html(.*)```', response.text, re.DOTALL).group(1).strip()
-        print("✅ Successfully generated initial code.")
-        return code
-    except AttributeError:
-        print("❌ Error: Could not extract code from Gemini's response. Using raw response.")
-        return response.text
+    prompt = f"""{CODE_GEN_PREFIX}
+BRIEF:
+{brief}
+
+EVALUATION CHECKS:
+{checks_str}
 
-def revise_code_with_gemini(brief, checks, attachments_content, original_code):
+ATTACHED FILE CONTENTS:
+{attachments_str}
+"""
+    response = _gemini_call(prompt)
+    code = _extract_html_block(response.text)
+    if code is None:
+        print("❌ Error: Could not extract code from Gemini's response. Using raw response.")
+        return UncachedResult(response.text)
+    print("✅ Successfully generated initial code.")
+    return code
+
+def _compact_html_for_prompt(html):
+    """Strips HTML comments outside raw-text elements and swaps long data URIs for placeholders."""
+    html = _HTML_COMMENT_RE.sub(lambda match: match.group(1) or "", html)
+    data_uris = {}
+    def stash(match):
+        placeholder = f"data:inline/{len(data_uris)},"
+        data_uris[placeholder] = match.group(0)
+        return placeholder
+    return _LONG_DATA_URI_RE.sub(stash, html), data_uris
+
+def _restore_data_uris(code, data_uris):
+    for placeholder, data_uri in data_uris.items():
+        code = code.replace(placeholder, data_uri)
+    return code
+
+@cached_llm
+def revise_code_with_gemini(brief, checks_str, attachments_str, original_code):
     """Revises existing code based on a new brief and checks."""
     print("🧠 Calling Gemini API to revise code...")
+    compact_code, data_uris = _compact_html_for_prompt(original_code)
     
     # --- PROMPT ENHANCEMENT: Added checks and attachments for revision ---
-    prompt = f"""
-    You are an expert full-stack web developer. Your task is to revise an existing HTML file based on a new brief.
-    Do not add any explanatory comments, just provide the final, complete, updated code.
+    prompt = f"""{CODE_REVISE_PREFIX}
+NEW REVISION BRIEF:
+{brief}
 
-    NEW REVISION BRIEF:
-    {brief}
+NEW EVALUATION CHECKS:
+{checks_str}
 
-    NEW EVALUATION CHECKS:
-    The updated code must pass these new checks:
-    - {'- '.join(checks)}
-    
-    NEW ATTACHED FILE CONTENTS:
-    {attachments_content if attachments_content else "None"}
-
-    ORIGINAL `index.html` CODE TO BE REVISED:
-    ```html
-    {original_code}
-    ```
-
-    Respond ONLY with the complete and updated HTML code inside a single markdown code block.
-    """
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    response = model.generate_content(prompt)
-    try:
-        code = re.search(r'```html(.*)```', response.text, re.DOTALL).group(1).strip()
-        print("✅ Successfully revised code.")
-        return code
-    except AttributeError:
+NEW ATTACHED FILE CONTENTS:
+{attachments_str}
+
+ORIGINAL `index.html` CODE TO BE REVISED:
+```html
+{compact_code}
+```
+"""
+    response = _gemini_call(prompt)
+    code = _extract_html_block(response.text)
+    if code is None:
         print("❌ Error: Could not extract revised code from Gemini's response. Using raw response.")
-        return response.text
+        return UncachedResult(_restore_data_uris(response.text, data_uris))
+    print("✅ Successfully revised code.")
+    return _restore_data_uris(code, data_uris)
 
+@cached_llm
 def generate_readme_with_gemini(brief):
     """Generates a README.md file with a new 'Code Explanation' section."""
     print("🧠 Calling Gemini API to generate README...")
 
     # --- PROMPT ENHANCEMENT: Added 'Code Explanation' section ---
-    prompt = f"""
-    You are a professional technical writer. Based on the following application brief, write a professional README.md file.
-    The README must include the following sections:
-    - A suitable title for the project.
-    - Summary: A brief summary of what the project does.
-    - Setup: Explain that it's a static site and no local setup is needed to run it.
-    - Usage: Explain how to view and use the live deployed page.
-    - Code Explanation: Briefly explain how the HTML, CSS, and JavaScript work together to achieve the goal.
-    - License: State that the project is under the MIT License.
-
-    APPLICATION BRIEF:
-    "{brief}"
-
-    Respond ONLY with the complete markdown content for the README.md file.
-    """
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    response = model.generate_content(prompt)
+    prompt = f"""{README_GEN_PREFIX}
+APPLICATION BRIEF:
+"{brief}"
+"""
+    response = _gemini_call(prompt)
     print("✅ README generated.")
     return response.text
 
+@cached_llm
 def revise_readme_with_gemini(brief, original_readme):
     """Revises an existing README file, including the code explanation."""
     print("🧠 Calling Gemini API to revise README...")
-    prompt = f"""
-    You are a technical writer. Your task is to update an existing README.md file based on a new brief describing changes to the application.
-    Ensure the summary, usage, and code explanation sections are updated to reflect the new functionality.
-    NEW BRIEF FOR CHANGES: "{brief}"
-    ORIGINAL README.md CONTENT:
-    {original_readme}
-    Respond ONLY with the complete and updated markdown content for the README.md file.
-    """
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    response = model.generate_content(prompt)
+    prompt = f"""{README_REVISE_PREFIX}
+NEW BRIEF FOR CHANGES: "{brief}"
+ORIGINAL README.md CONTENT:
+{original_readme}
+"""
+    response = _gemini_call(prompt)
     print("✅ README revised.")
     return response.text
 
 # --- 3. GITHUB & OTHER HELPER FUNCTIONS (UNCHANGED BUT ROBUST) ---
 
-def get_mit_license():
-    year = time.strftime("%Y")
-    # Using a multiline string for cleaner formatting
-    return f"""Copyright (c) {year} {GITHUB_USERNAME}
+_MIT_TEMPLATE = """Copyright (c) {year} {user}
 
 Permission is hereby granted, free of charge, to any person obtaining a copy
 of this software and associated documentation files (the "Software"), to deal
@@ -185,116 +395,291 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+@functools.lru_cache(maxsize=4)
+def _render_mit_license(year):
+    return _MIT_TEMPLATE.format(year=year, user=GITHUB_USERNAME)
+
+def get_mit_license():
+    # Keyed by year so the cached text still rolls over on New Year's
+    return _render_mit_license(time.strftime("%Y"))
+
 def create_github_repo(repo_name):
+    """Creates the repo and returns (repo_info, created); created is False if it already existed."""
     print(f"Creating GitHub repo: {repo_name}...")
     url = f"{GITHUB_API_URL}/user/repos"
-    headers = {"Authorization": f"token {GITHUB_TOKEN}", "Accept": "application/vnd.github.v3+json"}
-    payload = {"name": repo_name, "private": False, "description": f"AI-generated app for task: {repo_name}"}
-    response = requests.post(url, headers=headers, json=payload)
+    # auto_init gives the repo a 'main' branch right away, so the initial files can go in as a
+    # single Git Data API commit instead of one Contents API commit per file
+    payload = {"name": repo_name, "private": False, "auto_init": True, "description": f"AI-generated app for task: {repo_name}"}
+    response = _gh_session.post(url, data=orjson.dumps(payload), headers=JSON_HEADERS)
     if response.status_code == 201:
         print("✅ Repo created successfully.")
-        return response.json()
+        return orjson.loads(response.content), True
     elif response.status_code == 422:
         print("⚠️ Repo already exists. Will proceed.")
-        return {"html_url": f"https://github.com/{GITHUB_USERNAME}/{repo_name}"}
+        return {"html_url": f"https://github.com/{GITHUB_USERNAME}/{repo_name}"}, False
     else:
         raise Exception(f"GitHub repo creation failed with status {response.status_code}: {response.text}")
 
-def create_or_update_files_in_repo(repo_name, files_with_content, commit_message):
-    print(f"Pushing {len(files_with_content)} files to {repo_name}...")
-    headers = {"Authorization": f"token {GITHUB_TOKEN}", "Accept": "application/vnd.github.v3+json"}
-    latest_commit_sha = ""
+def _put_files_one_by_one(repo_name, files_with_content, content_bytes, commit_message):
+    """Pushes files through the Contents API, one commit per file."""
+    # Encode and serialize every payload up front so the request loop only does network I/O
+    payloads = {}
     for file_path, data in files_with_content.items():
-        url = f"{GITHUB_API_URL}/repos/{GITHUB_USERNAME}/{repo_name}/contents/{file_path}"
-        content_encoded = base64.b64encode(data["content"].encode('utf-8')).decode('utf-8')
-        payload = {"message": commit_message, "content": content_encoded, "committer": {"name": "LLM Code Bot", "email": "bot@example.com"}}
+        content_encoded = base64.b64encode(content_bytes[file_path]).decode('ascii')
+        payload = {"message": commit_message, "content": content_encoded, "committer": COMMITTER}
         if data.get("sha"): payload["sha"] = data["sha"]
-        response = requests.put(url, headers=headers, json=payload)
+        payloads[file_path] = orjson.dumps(payload)
+
+    latest_commit_sha = ""
+    for file_path, body in payloads.items():
+        url = f"{GITHUB_API_URL}/repos/{GITHUB_USERNAME}/{repo_name}/contents/{file_path}"
+        response = _gh_session.put(url, data=body, headers=JSON_HEADERS)
         if response.status_code in [200, 201]:
-            latest_commit_sha = response.json()["commit"]["sha"]
+            latest_commit_sha = orjson.loads(response.content)["commit"]["sha"]
             print(f"  - ✅ Pushed {file_path}")
         else:
             raise Exception(f"GitHub push failed for {file_path} with status {response.status_code}: {response.text}")
-    print(f"✅ All files pushed. Latest commit SHA: {latest_commit_sha}")
     return latest_commit_sha
 
+def _remember_pushed_files(repo_name, files_with_content, content_bytes):
+    # Only the README is ever read back (on revise), so it is the only file kept
+    for file_path in PUSHED_FILES_TO_REMEMBER & files_with_content.keys():
+        raw = content_bytes[file_path]
+        # Same sha GitHub reports for the file: sha1 over the git blob header and content
+        blob_sha = hashlib.sha1(b"blob %d\0" % len(raw) + raw).hexdigest()
+        _bounded_set(_pushed_files, (repo_name, file_path), {"content": files_with_content[file_path]["content"], "sha": blob_sha})
+
+def create_or_update_files_in_repo(repo_name, files_with_content, commit_message):
+    """Pushes all files as a single commit on main using the Git Data API."""
+    print(f"Pushing {len(files_with_content)} files to {repo_name}...")
+    repo_url = f"{GITHUB_API_URL}/repos/{GITHUB_USERNAME}/{repo_name}"
+    # UTF-8 encode each file once; the fallback upload bodies and the pushed-file shas both reuse it
+    content_bytes = {file_path: data["content"].encode('utf-8') for file_path, data in files_with_content.items()}
+
+    # The branch endpoint returns the head commit and its tree in one call
+    branch_response = _gh_session.get(f"{repo_url}/branches/main")
+    if branch_response.status_code in [404, 409]:
+        # The Git Data API cannot write to an empty repo (e.g. one created without auto_init),
+        # so fall back to one commit per file
+        print("⚠️ Branch 'main' does not exist yet. Pushing files one by one.")
+        latest_commit_sha = _put_files_one_by_one(repo_name, files_with_content, content_bytes, commit_message)
+        _remember_pushed_files(repo_name, files_with_content, content_bytes)
+        print(f"✅ All files pushed. Latest commit SHA: {latest_commit_sha}")
+        return latest_commit_sha
+    elif branch_response.status_code != 200:
+        raise Exception(f"Failed to fetch branch 'main' with status {branch_response.status_code}: {branch_response.text}")
+    head_commit = orjson.loads(branch_response.content)["commit"]
+    parent_sha = head_commit["sha"]
+    base_tree_sha = head_commit["commit"]["tree"]["sha"]
+
+    # File contents go inline in the tree, so GitHub creates the blobs without an upload per file
+    tree = [{"path": file_path, "mode": "100644", "type": "blob", "content": data["content"]}
+            for file_path, data in files_with_content.items()]
+    response = _gh_session.post(f"{repo_url}/git/trees", data=orjson.dumps({"base_tree": base_tree_sha, "tree": tree}), headers=JSON_HEADERS)
+    if response.status_code != 201:
+        raise Exception(f"GitHub tree creation failed with status {response.status_code}: {response.text}")
+    tree_sha = orjson.loads(response.content)["sha"]
+
+    payload = {"message": commit_message, "tree": tree_sha, "parents": [parent_sha], "committer": COMMITTER}
+    response = _gh_session.post(f"{repo_url}/git/commits", data=orjson.dumps(payload), headers=JSON_HEADERS)
+    if response.status_code != 201:
+        raise Exception(f"GitHub commit creation failed with status {response.status_code}: {response.text}")
+    commit_sha = orjson.loads(response.content)["sha"]
+
+    response = _gh_session.patch(f"{repo_url}/git/refs/heads/main", data=orjson.dumps({"sha": commit_sha}), headers=JSON_HEADERS)
+    if response.status_code != 200:
+        raise Exception(f"Updating branch 'main' failed with status {response.status_code}: {response.text}")
+    _remember_pushed_files(repo_name, files_with_content, content_bytes)
+    print(f"✅ All files pushed in one commit. Commit SHA: {commit_sha}")
+    return commit_sha
+
 def get_file_from_repo(repo_name, file_path):
     print(f"Fetching '{file_path}' from '{repo_name}'...")
     url = f"{GITHUB_API_URL}/repos/{GITHUB_USERNAME}/{repo_name}/contents/{file_path}"
-    headers = {"Authorization": f"token {GITHUB_TOKEN}", "Accept": "application/vnd.github.v3+json"}
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        data = response.json()
+    # A conditional GET answers 304 for unchanged files without using rate-limit quota
+    cached = _file_cache.get((repo_name, file_path))
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    response = _gh_session.get(url, headers=headers)
+    if response.status_code == 304:
+        print(f"✅ '{file_path}' unchanged since last fetch (sha: {cached[1]['sha']})")
+        return cached[1]
+    elif response.status_code == 200:
+        data = orjson.loads(response.content)
         content = base64.b64decode(data['content']).decode('utf-8')
         print(f"✅ Fetched '{file_path}' (sha: {data['sha']})")
-        return {"content": content, "sha": data['sha']}
+        result = {"content": content, "sha": data['sha']}
+        if response.headers.get("ETag"):
+            _bounded_set(_file_cache, (repo_name, file_path), (response.headers["ETag"], result))
+        return result
     else:
         raise Exception(f"Failed to fetch {file_path} with status {response.status_code}: {response.text}")
 
-def enable_github_pages(repo_name):
+def get_pushed_or_remote_file(repo_name, file_path):
+    """Returns the file as this process last pushed it, fetching it from GitHub only when unknown."""
+    pushed = _pushed_files.get((repo_name, file_path))
+    if pushed:
+        print(f"✅ Using '{file_path}' as last pushed to '{repo_name}' (sha: {pushed['sha']})")
+        return pushed
+    return get_file_from_repo(repo_name, file_path)
+
+def _pages_state_path(repo_name):
+    # Task names come from the request body, so keep them from escaping STATE_DIR
+    return STATE_DIR / f"{repo_name.replace('/', '_').replace(os.sep, '_')}.json"
+
+def _load_pages_url(repo_name):
+    if repo_name not in _pages_url_cache:
+        try:
+            state = json.loads(_pages_state_path(repo_name).read_text(encoding='utf-8'))
+            _pages_url_cache[repo_name] = state["pages_url"]
+        except (OSError, ValueError, KeyError):
+            return None
+    return _pages_url_cache[repo_name]
+
+def _remember_pages_url(repo_name, pages_url):
+    _pages_url_cache[repo_name] = pages_url
+    try:
+        STATE_DIR.mkdir(parents=True, exist_ok=True)
+        _pages_state_path(repo_name).write_text(json.dumps({"pages_url": pages_url}), encoding='utf-8')
+    except OSError as e:
+        # Read-only filesystems (e.g. Vercel) just lose the on-disk copy
+        print(f"⚠️  Could not save Pages URL for {repo_name}: {e}")
+
+def _forget_pages_url(repo_name):
+    _pages_url_cache.pop(repo_name, None)
+    try:
+        _pages_state_path(repo_name).unlink(missing_ok=True)
+    except OSError as e:
+        print(f"⚠️  Could not remove saved Pages URL for {repo_name}: {e}")
+
+def enable_github_pages(repo_name, use_cache=False):
+    # Only trust the saved URL for a repo known to exist (revise); a rebuilt repo needs Pages again
+    pages_url = _load_pages_url(repo_name) if use_cache else None
+    if pages_url:
+        print(f"✅ GitHub Pages already enabled for {repo_name} at: {pages_url}")
+        return pages_url
     print(f"Enabling GitHub Pages for {repo_name}...")
     url = f"{GITHUB_API_URL}/repos/{GITHUB_USERNAME}/{repo_name}/pages"
-    headers = {"Authorization": f"token {GITHUB_TOKEN}", "Accept": "application/vnd.github.v3+json"}
+    # Check first: on revise Pages is already enabled, and this saves a POST that would fail
+    response = _gh_session.get(url)
+    if response.status_code == 200:
+        pages_url = orjson.loads(response.content)["html_url"]
+        print(f"✅ GitHub Pages was already enabled at: {pages_url}")
+        _remember_pages_url(repo_name, pages_url)
+        return pages_url
+    elif response.status_code != 404:
+        raise Exception(f"Checking GitHub Pages failed with status {response.status_code}: {response.text}")
+
+    # Pages is off for this repo, so any saved URL belongs to a deleted predecessor
+    _forget_pages_url(repo_name)
     payload = {"source": {"branch": "main", "path": "/"}}
-    response = requests.post(url, headers=headers, json=payload)
+    response = _gh_session.post(url, data=orjson.dumps(payload), headers=JSON_HEADERS)
     if response.status_code == 201:
-        pages_url = response.json()["html_url"]
+        pages_url = orjson.loads(response.content)["html_url"]
         print(f"✅ GitHub Pages enabled. It may take a minute to go live at: {pages_url}")
+        _remember_pages_url(repo_name, pages_url)
         return pages_url
-    else:
-        get_response = requests.get(url, headers=headers)
-        if get_response.status_code == 200:
-            pages_url = get_response.json()["html_url"]
-            print(f"✅ GitHub Pages was already enabled at: {pages_url}")
+    elif response.status_code == 409:
+        # Enabled concurrently since the GET; ask again so a custom domain gets its real URL
+        response = _gh_session.get(url)
+        if response.status_code == 200:
+            pages_url = orjson.loads(response.content)["html_url"]
+            print(f"✅ GitHub Pages was enabled concurrently at: {pages_url}")
+            _remember_pages_url(repo_name, pages_url)
             return pages_url
+        # Fall back to the default project-site URL, but don't persist a guess
+        pages_url = f"https://{GITHUB_USERNAME.lower()}.github.io/{repo_name}/"
+        print(f"⚠️  GitHub Pages was enabled concurrently; assuming: {pages_url}")
+        return pages_url
+    else:
+        raise Exception(f"GitHub Pages enabling failed with status {response.status_code}: {response.text}")
+
+def wait_for_pages_deploy(repo_name, pages_url, commit_sha, max_wait=30, poll_interval=2):
+    """Polls the latest Pages build until it has deployed commit_sha, giving up after max_wait seconds."""
+    print(f"Waiting up to {max_wait} seconds for GitHub Pages to deploy...")
+    url = f"{GITHUB_API_URL}/repos/{GITHUB_USERNAME}/{repo_name}/pages/builds/latest"
+    # A monotonic deadline also counts the time spent in each poll, so max_wait is a real bound
+    start = time.monotonic()
+    deadline = start + max_wait
+    while time.monotonic() + poll_interval <= deadline:
+        time.sleep(poll_interval)
+        waited = round(time.monotonic() - start)
+        response = _gh_session.get(url, timeout=max(deadline - time.monotonic(), 1))
+        if response.status_code == 200:
+            build = orjson.loads(response.content)
+            if build["commit"] != commit_sha:
+                continue
+            if build["status"] == "built":
+                print(f"✅ GitHub Pages deployed after ~{waited}s.")
+                return
+            elif build["status"] == "errored":
+                print(f"⚠️ GitHub Pages build errored: {build.get('error', {}).get('message')}")
+                return
         else:
-            raise Exception(f"GitHub Pages enabling failed with status {response.status_code}: {response.text}")
+            # No build info available, so fall back to checking that the site answers at all
+            try:
+                if requests.head(pages_url, timeout=max(deadline - time.monotonic(), 1)).status_code == 200:
+                    print(f"✅ GitHub Pages is live after ~{waited}s.")
+                    return
+            except requests.exceptions.RequestException:
+                pass
+    print(f"⚠️ GitHub Pages deploy not confirmed after {round(time.monotonic() - start)}s. Proceeding anyway.")
 
 def notify_evaluation_api(payload):
     url = payload.pop("evaluation_url")
     print(f"📢 Notifying evaluation server at {url}...")
-    headers = {"Content-Type": "application/json"}
-    for i, delay in enumerate([1, 2, 4, 8]):
-        try:
-            response = requests.post(url, headers=headers, json=payload, timeout=15)
-            if response.status_code == 200:
-                print("✅ Successfully notified evaluation server.")
-                return
-            else:
-                print(f"⚠️ Notification failed with status {response.status_code}. Retrying in {delay}s...")
-        except requests.exceptions.RequestException as e:
-            print(f"⚠️ Notification request failed: {e}. Retrying in {delay}s...")
-        if i < 3: time.sleep(delay)
-    raise Exception("Could not notify the evaluation server after multiple retries.")
+    # Retries (with backoff and Retry-After) are handled by the session's adapter
+    try:
+        response = _notify_session.post(url, data=orjson.dumps(payload), timeout=15)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        raise Exception(f"Could not notify the evaluation server after multiple retries: {e}")
+    print("✅ Successfully notified evaluation server.")
 
 # --- 4. CORE PROCESSING LOGIC (UPDATED) ---
 
+def format_prompt_inputs(data):
+    """Formats the request's attachments and checks once, as they appear in the prompts."""
+    attachments_str = process_attachments(data.get("attachments")) or "None"
+    checks_str = "\n".join(f"- {check}" for check in data.get("checks", [])) or "None"
+    return attachments_str, checks_str
+
 def process_request(data):
     """Handles a round 1 'build' request using all available data."""
     repo_name = data["task"]
     print(f"🚀 Starting BUILD process for task: {repo_name}, round: 1")
 
     # --- ENHANCEMENT: Process attachments and use checks ---
-    attachments_content = process_attachments(data.get("attachments"))
-    checks = data.get("checks", [])
+    attachments_str, checks_str = format_prompt_inputs(data)
     
-    html_content = generate_code_with_gemini(data["brief"], checks, attachments_content)
-    readme_content = generate_readme_with_gemini(data["brief"])
-    license_content = get_mit_license()
-
-    repo_info = create_github_repo(repo_name)
+    # --- The Gemini calls and repo creation are independent, so run them together ---
+    with ThreadPoolExecutor(max_workers=3) as ex:
+        fut_html = ex.submit(generate_code_with_gemini, data["brief"], checks_str, attachments_str)
+        fut_readme = ex.submit(generate_readme_with_gemini, data["brief"])
+        fut_repo = ex.submit(create_github_repo, repo_name)
+        license_content = get_mit_license()
+        html_content = fut_html.result()
+        readme_content = fut_readme.result()
+        repo_info, repo_created = fut_repo.result()
 
     files_to_push = {
         "index.html": {"content": html_content},
         "README.md": {"content": readme_content},
         "LICENSE": {"content": license_content}
     }
-    commit_sha = create_or_update_files_in_repo(repo_name, files_to_push, "feat: Initial commit")
-    pages_url = enable_github_pages(repo_name)
-    
-    # --- ENHANCEMENT: Shortened wait time for robustness ---
-    print("Waiting 30 seconds for GitHub Pages to deploy...")
-    time.sleep(30)
+    if repo_created:
+        # auto_init means 'main' already exists, so Pages can be enabled while the files are pushed
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            fut_commit = ex.submit(create_or_update_files_in_repo, repo_name, files_to_push, "feat: Initial commit")
+            fut_pages = ex.submit(enable_github_pages, repo_name)
+            commit_sha = fut_commit.result()
+            pages_url = fut_pages.result()
+    else:
+        # A pre-existing repo may be empty, and Pages needs the branch the push creates
+        commit_sha = create_or_update_files_in_repo(repo_name, files_to_push, "feat: Initial commit")
+        pages_url = enable_github_pages(repo_name)
+
+    # Pages must be live before the evaluator is told to check it, so these stay sequential
+    wait_for_pages_deploy(repo_name, pages_url, commit_sha)
 
     notification_payload = {
         "email": data["email"], "task": data["task"], "round": 1, "nonce": data["nonce"],
@@ -310,25 +695,27 @@ def process_revision_request(data):
     print(f"🚀 Starting REVISE process for task: {repo_name}, round: 2")
 
     # --- ENHANCEMENT: Process attachments and use checks for revision ---
-    attachments_content = process_attachments(data.get("attachments"))
-    checks = data.get("checks", [])
+    attachments_str, checks_str = format_prompt_inputs(data)
     
-    original_html = get_file_from_repo(repo_name, "index.html")
-    original_readme = get_file_from_repo(repo_name, "README.md")
-
-    revised_html_content = revise_code_with_gemini(data["brief"], checks, attachments_content, original_html["content"])
-    revised_readme_content = revise_readme_with_gemini(data["brief"], original_readme["content"])
+    with ThreadPoolExecutor(max_workers=3) as ex:
+        fut_pages = ex.submit(enable_github_pages, repo_name, use_cache=True)
+        fut_html = ex.submit(get_file_from_repo, repo_name, "index.html")
+        fut_readme = ex.submit(get_pushed_or_remote_file, repo_name, "README.md")
+        original_html = fut_html.result()
+        original_readme = fut_readme.result()
+
+        fut_html = ex.submit(revise_code_with_gemini, data["brief"], checks_str, attachments_str, original_html["content"])
+        fut_readme = ex.submit(revise_readme_with_gemini, data["brief"], original_readme["content"])
+        revised_html_content = fut_html.result()
+        revised_readme_content = fut_readme.result()
+        pages_url = fut_pages.result()
 
     files_to_update = {
         "index.html": {"content": revised_html_content, "sha": original_html["sha"]},
         "README.md": {"content": revised_readme_content, "sha": original_readme["sha"]}
     }
     commit_sha = create_or_update_files_in_repo(repo_name, files_to_update, "feat: Apply revisions for round 2")
-    pages_url = enable_github_pages(repo_name)
-    
-    # --- ENHANCEMENT: Shortened wait time for robustness ---
-    print("Waiting 30 seconds for GitHub Pages to redeploy...")
-    time.sleep(30)
+    wait_for_pages_deploy(repo_name, pages_url, commit_sha)
 
     notification_payload = {
         "email": data["email"], "task": data["task"], "round": 2, "nonce": data["nonce"],
@@ -338,7 +725,14 @@ def process_revision_request(data):
     notify_evaluation_api(notification_payload)
     print(f"🎉 Successfully completed REVISE task: {repo_name}")
 
-# --- 5. FLASK API ENDPOINT (UNCHANGED) ---
+def run_task_in_background(process, data):
+    """Runs a build/revise task on the executor, logging failures since no response is waiting."""
+    try:
+        process(data)
+    except Exception as e:
+        print(f"❌ A critical error occurred in task {data.get('task')}: {str(e)}")
+
+# --- 5. FLASK API ENDPOINT ---
 
 @app.route('/api/build', methods=['POST'])
 def handle_build_request():
@@ -352,18 +746,27 @@ def handle_build_request():
 
     print(f"✅ Secret verified for task: {data.get('task')}")
 
+    # Background tasks can only report failures to the log, so reject incomplete requests up front
+    missing = [key for key in REQUIRED_REQUEST_FIELDS if not data.get(key)]
+    if missing:
+        return jsonify({"error": f"Missing required fields: {', '.join(missing)}"}), 400
+
+    process = process_revision_request if data.get("round") == 2 else process_request
+    if RUN_TASKS_IN_BACKGROUND:
+        # The evaluation_url notification signals completion, so acknowledge right away
+        TASK_EXECUTOR.submit(run_task_in_background, process, data)
+        return jsonify({"status": "accepted"}), 202
+
     try:
-        if data.get("round") == 2:
-            process_revision_request(data)
-        else:
-            process_request(data)
+        process(data)
         return jsonify({"status": "Process completed successfully."}), 200
     except Exception as e:
         error_message = f"A critical error occurred: {str(e)}"
         print(f"❌ {error_message}")
         return jsonify({"error": error_message}), 500
 
-# --- 6. LOCAL DEVELOPMENT SERVER (UNCHANGED) ---
+# --- 6. LOCAL DEVELOPMENT SERVER ---
+# Production traffic is served by gunicorn (see Procfile); this is for local runs only.
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)
\ No newline at end of file
+    app.run(debug=os.getenv("FLASK_DEBUG") == "1", port=5001)
\ No newline at end of file
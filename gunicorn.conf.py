@@ -0,0 +1,12 @@
+# gunicorn.conf.py
+
+import multiprocessing
+import os
+
+# Loaded automatically by `gunicorn app:app` from the project root.
+# Requests are only handed off to the background executor, so threads are cheap to keep around.
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = 8
+timeout = 300